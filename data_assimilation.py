@@ -3,6 +3,12 @@
 """
 Data Assimilation on temperature readings
 
+The query functions take the temperature DataFrame and read it directly, so
+they always see its current contents.  Nothing is cached between calls.  For
+many queries on the same data, build a TempDataView once and pass it in place
+of the DataFrame; it is an explicit snapshot and must be rebuilt after the
+DataFrame changes.
+
 @author: Kari_Eifler
 """
 import pandas as pd
@@ -13,6 +19,200 @@ import cvxpy as cp
 
 
 
+def build_soa(df):
+    """
+    Converts the passed DataFrame, df, into a struct of np.arrays holding only
+    what the queries in this module need.
+    df - A Pandas DataFrame with MultiIndex containing the station ID and years of
+        operation, and columns containing the mean temperature recorded at each
+        station during the month (column) and year (row).
+    Returns - A tuple (values, station_codes, years) where values is the 2D float32
+        array of temperatures (one row per row of df, one column per month), 
+        station_codes holds the int32 position of each row's station ID in 
+        df.index.levels[0], and years holds the year of each row.
+    """
+    # float32 holds the few significant digits of a temperature reading and
+    # halves the memory traffic of every query; aggregates are returned as 
+    # float64 and raw readings come from a float64 copy (see TempDataView)
+    values = df.to_numpy(dtype=np.float32)
+    station_codes = df.index.codes[0].astype(np.int32)
+    years = df.index.get_level_values(1).to_numpy()
+    return (values, station_codes, years)
+
+
+class TempDataView:
+    """
+    Caches the contents of a temperature DataFrame as np.arrays (see build_soa)
+    along with the sort order of its years and which of its values are valid
+    (non-NaN), so that the rows belonging to a 
+    range of years can be found by binary search and every query reduces to
+    masking and reducing np.arrays.  Every query function in this module
+    accepts a TempDataView in place of its DataFrame; building one costs more
+    than a single query on the DataFrame, so build it with TempDataView(df) 
+    when running many queries and reuse it.  The view is a snapshot that holds
+    its own copy of the readings and never reads df again: build a new one 
+    after modifying df.
+    df - A Pandas DataFrame with MultiIndex containing the station ID and years of
+        operation, and columns containing the mean temperature recorded at each
+        station during the month (column) and year (row).
+    """
+    def __init__(self, df):
+        self.index = df.index
+        self.columns = df.columns
+        self.station_ids = df.index.levels[0]
+        (self.values, self.station_codes, self.years) = build_soa(df)
+        # full precision copy for the queries returning raw readings
+        self.readings = df.to_numpy(dtype=np.float64, copy=True)
+        # validity bitmaps, so queries need not test temperatures for NaN
+        self.valid = ~np.isnan(self.values)
+        self.any_valid = self.valid.any(axis=1)
+        self.order = np.argsort(self.years, kind='stable')
+        self.sorted_years = self.years[self.order]
+    
+    def rows(self, begin_year=None, end_year=None):
+        """
+        Returns a np.array with the positions, in ascending order, of the rows
+        whose year lies in the range [begin_year, end_year], inclusive.  A bound
+        that is None leaves that end of the range open.
+        """
+        lo = 0
+        hi = len(self.sorted_years)
+        if begin_year is not None:
+            lo = np.searchsorted(self.sorted_years, begin_year, side='left')
+        if end_year is not None:
+            hi = np.searchsorted(self.sorted_years, end_year, side='right')
+        return np.sort(self.order[lo:hi])
+    
+    def values_at(self, rows):
+        """
+        Returns the 2D np.array of temperatures in the given rows.
+        """
+        if len(rows) == len(self.values): #every row, no need to copy
+            return self.values
+        return self.values[rows]
+    
+    def valid_at(self, rows):
+        """
+        Returns the 2D boolean np.array telling which temperatures in the given
+        rows are valid (non-NaN).
+        """
+        if len(rows) == len(self.valid): #every row, no need to copy
+            return self.valid
+        return self.valid[rows]
+    
+    def any_valid_at(self, rows):
+        """
+        Returns a boolean np.array telling which of the given rows hold at least 
+        one valid temperature.
+        """
+        return self.any_valid[rows]
+    
+    def readings_at(self, rows, month_idx):
+        """
+        Returns the float64 temperatures of column month_idx in the given rows.
+        """
+        return self.readings[rows, month_idx]
+    
+    def stations(self, rows):
+        """
+        Returns a Pandas Index with the unique station ID's of the given rows, in
+        order of first appearance.
+        """
+        return _unique_stations(self.station_ids, self.station_codes[rows])
+
+
+class _FrameView:
+    """
+    Answers the same row queries as TempDataView directly from a DataFrame,
+    without converting it.  Years are selected by a single compare on the
+    year level and only the selected rows (or month column) are read, which 
+    is cheaper than building a TempDataView for a single query.
+    """
+    def __init__(self, df):
+        self.df = df
+        self.columns = df.columns
+    
+    def rows(self, begin_year=None, end_year=None):
+        """
+        Returns a np.array with the positions, in ascending order, of the rows
+        whose year lies in the range [begin_year, end_year], inclusive.  A bound
+        that is None leaves that end of the range open.
+        """
+        index = self.df.index
+        if index.levels[1].is_monotonic_increasing:
+            # compare the small integer codes of the sorted year level instead
+            # of materializing the years of every row
+            years = index.codes[1]
+            if begin_year is not None or end_year is not None: #skip missing years, code -1
+                begin_year = 0 if begin_year is None else \
+                             index.levels[1].searchsorted(begin_year, side='left')
+            if end_year is not None:
+                end_year = index.levels[1].searchsorted(end_year, side='right') - 1
+        else:
+            years = index.get_level_values(1).to_numpy()
+        mask = np.ones(len(years), dtype=bool)
+        if begin_year is not None:
+            mask &= years >= begin_year
+        if end_year is not None:
+            mask &= years <= end_year
+        return np.flatnonzero(mask)
+    
+    def values_at(self, rows):
+        """
+        Returns the 2D float64 np.array of temperatures in the given rows.
+        """
+        values = self.df.to_numpy(dtype=np.float64, copy=False)
+        if len(rows) == len(values): #every row, no need to copy
+            return values
+        return values[rows]
+    
+    def valid_at(self, rows):
+        """
+        Returns the 2D boolean np.array telling which temperatures in the given
+        rows are valid (non-NaN).
+        """
+        return ~np.isnan(self.values_at(rows))
+    
+    def any_valid_at(self, rows):
+        """
+        Returns a boolean np.array telling which of the given rows hold at least 
+        one valid temperature.
+        """
+        return self.valid_at(rows).any(axis=1)
+    
+    def readings_at(self, rows, month_idx):
+        """
+        Returns the float64 temperatures of column month_idx in the given rows.
+        """
+        return self.df.iloc[:, month_idx].to_numpy(dtype=np.float64)[rows]
+    
+    def stations(self, rows):
+        """
+        Returns a Pandas Index with the unique station ID's of the given rows, in
+        order of first appearance.
+        """
+        return _unique_stations(self.df.index.levels[0], self.df.index.codes[0][rows])
+
+
+def _unique_stations(station_ids, codes):
+    """
+    Returns a Pandas Index with the entries of station_ids selected by the 
+    unique values of codes, in order of first appearance.
+    """
+    (unique_codes, first_idx) = np.unique(codes, return_index=True)
+    return station_ids.take(codes[np.sort(first_idx)])
+
+
+def _as_view(df):
+    """
+    Returns df if it is already a TempDataView, and a _FrameView reading df
+    directly otherwise.
+    """
+    if isinstance(df, TempDataView):
+        return df
+    return _FrameView(df)
+
+
 def compute_monthly_temperature_means(df, begin_year=None, end_year=None):
     """
     Computes the mean temperature of every column (month) in the passed DataFrame, df,
@@ -21,6 +221,7 @@ def compute_monthly_temperature_means(df, begin_year=None, end_year=None):
     level contains the set of years during which the corresponding station was in 
     service.  The mean temperatures are given per column for all stations operating
     wholly or partially within the given range [begin_year, end_year].
+    A TempDataView of the DataFrame may be passed as df instead.
     begin_year - The first year to be included in the mean.  If begin_year is None
         then the first available year in the data is used.  All stations in service
         during this year or after (but not after end_year) are inlcuded in the means.
@@ -31,16 +232,22 @@ def compute_monthly_temperature_means(df, begin_year=None, end_year=None):
         the DataFrame over the specified range of years.  The series name property will
         be set to 'monthly mean'.
     """
-    if begin_year is not None and end_year is not None:
-        pd2 = df.loc[pd.IndexSlice[:, range(begin_year, end_year+1)], :]
-    elif begin_year is None and end_year is not None:
-        pd2 = df.loc[pd.IndexSlice[:, range(0, end_year+1)], :]
-    elif begin_year is not None and end_year is None:
-        pd2 = df.loc[pd.IndexSlice[:, range(begin_year, 2021)], :]
-    else: #both are None
-        pd2 = df
+    view = _as_view(df)
+    rows = view.rows(begin_year, end_year)
+    values = view.values_at(rows)
     
-    return pd2.mean(axis = 0)
+    # NaN-skipping mean of every column
+    if isinstance(view, TempDataView):
+        valid = view.valid_at(rows)
+    else: #a _FrameView would select the rows again
+        valid = ~np.isnan(values)
+    # values and valid are column-major, so reduce each column as a contiguous row
+    # of the transpose
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sums = np.where(valid.T, values.T, 0).sum(axis=1, dtype=np.float64)
+        means = sums / valid.T.sum(axis=1)
+    
+    return pd.Series(means, index=view.columns)
 
 
 def compute_annual_temperature_means(df, begin_year=None, end_year=None):
@@ -57,6 +264,7 @@ def compute_annual_temperature_means(df, begin_year=None, end_year=None):
          mean temperatures from all stations operating during the given month and year.
       2) The annual mean is computed by the naive mean of all rows in the result of the 
          first step.
+    A TempDataView of the DataFrame may be passed as df instead.
     begin_year - The first year to be included in the mean.  If begin_year is None
         then the first available year in the data is used.  All stations in service
         during this year or after (but not after end_year) are inlcuded in the means.
@@ -81,7 +289,8 @@ def get_operating_stations_by_year(df, begin_year=None, end_year=None):
     range of years.
     df - A Pandas DataFrame with MultiIndex containing the station ID and years of
         operation, and columns containing the mean temperature recorded at each
-        station during the month (column) and year (row).
+        station during the month (column) and year (row).  A TempDataView 
+        of the DataFrame may be passed instead.
     begin_year - The first year to be included.  If begin_year is None then the 
         first available year in the data is used.  All stations in service during 
         this year or after (but not after end_year) are inlcuded in the set of 
@@ -94,16 +303,12 @@ def get_operating_stations_by_year(df, begin_year=None, end_year=None):
         given range of years.  The name property of the Index set will be set to 
         'ID'.
     """
-    if begin_year is None:
-        begin_year = 0
-    if end_year is None:
-        end_year = 2021
-    
-    df2 = df.loc[(slice(None), range(begin_year,end_year+1)),:]
+    view = _as_view(df)
+    rows = view.rows(begin_year, end_year)
     
-    df3 = df2.dropna(thresh=1) #at least one month is not NaN
+    rows = rows[view.any_valid_at(rows)] #at least one month is not NaN
     
-    stations = df3.index.get_level_values(0)
+    stations = view.stations(rows)
     
     return stations
     
@@ -115,7 +320,8 @@ def get_operating_stations_by_month(df, month, begin_year=None, end_year=None):
     valid (non-NaN) data during the given month (not necessarily in all years).  
     df - A Pandas DataFrame with MultiIndex containing the station ID and years of
         operation, and columns containing the mean temperature recorded at each
-        station during the month (column) and year (row).
+        station during the month (column) and year (row).  A TempDataView 
+        of the DataFrame may be passed instead.
     month - A string from the set of column names (months) in df.  Only stations
         with valid (non-NaN) data during this month will be included in the returned
         Pandas Index.
@@ -131,16 +337,13 @@ def get_operating_stations_by_month(df, month, begin_year=None, end_year=None):
         given range of years with valid data in month.  The name property of the 
         Index set will be set to 'ID'.
     """
-    if begin_year is None:
-        begin_year = 0
-    if end_year is None:
-        end_year = 2021
+    view = _as_view(df)
+    rows = view.rows(begin_year, end_year)
+    month_idx = view.columns.get_loc(month)
     
-    df2 = df.loc[(slice(None), range(begin_year,end_year+1)),:]
-    df3 = df2[month]
-    df3 = df3.dropna()
+    rows = rows[~np.isnan(view.readings_at(rows, month_idx))]
     
-    stations = df3.index.get_level_values(0)
+    stations = view.stations(rows)
     
     return stations
 
@@ -162,15 +365,14 @@ def get_station_locations(inv_df, stations=None):
         property for the returned Series will be set to their respective 
         column names in inv_df.
     """
-    df2 = inv_df.T
+    df2 = inv_df
     
     if stations is not None:
-        df2 = df2[stations]
-    
-    df3 = df2.T #transpose
+        stations = pd.Index(stations, name=inv_df.index.name)
+        df2 = inv_df.loc[stations[stations.isin(inv_df.index)]] #only stations in inv_df
     
-    latitudes = df3['lat']
-    longitudes = df3['lon']
+    latitudes = df2['lat']
+    longitudes = df2['lon']
     
     return[latitudes, longitudes]
     
@@ -185,7 +387,8 @@ def get_valid_station_temps_by_month(df, month, year):
     and year (single year, not range of years).
     df - A Pandas DataFrame with MultiIndex containing the station ID and years of
         operation, and columns containing the mean temperature recorded at each
-        station during the month (column) and year (row).
+        station during the month (column) and year (row).  A TempDataView 
+        of the DataFrame may be passed instead.
     month - A string from the set of column names (months) in df.  Only stations
         with valid (non-NaN) data during this month will be included in the array 
         of temperatures returned.
@@ -195,10 +398,11 @@ def get_valid_station_temps_by_month(df, month, year):
     Returns - A np.array containing the temperatures of all operating stations in 
     the given year with valid data in month.
     """
-    df2 = gistemp_df.loc[(slice(None), range(year,year+1)), month]
-    df3 = df2.dropna()
+    view = _as_view(df)
+    month_idx = view.columns.get_loc(month)
+    temps = view.readings_at(view.rows(year, year), month_idx)
     
-    station_temps = df3.to_numpy()
+    station_temps = temps[~np.isnan(temps)]
     
     return station_temps
 
@@ -212,22 +416,20 @@ def get_valid_station_temps_by_year(df, year):
     years).
     df - A Pandas DataFrame with MultiIndex containing the station ID and years of
         operation, and columns containing the mean temperature recorded at each
-        station during the month (column) and year (row).
+        station during the month (column) and year (row).  A TempDataView 
+        of the DataFrame may be passed instead.
     year - Numeric value representing a year from df.  Stations in service during 
         this year with valid data are inlcuded in the set of annual means returned.
     Returns - A np.array containing the annual mean temperatures from all operating
         stations in the given year.
     """
-    df2 = df.loc[(slice(None), range(year,year+1)), :]
-    
-    df3 = df2.dropna(thresh=1) #at least one month is not NaN
-    
+    view = _as_view(df)
+    rows = view.rows(year, year)
     
-    df4 = df3.T
-    df4.columns = df4.columns.droplevel(1)
+    values = view.values_at(rows)
+    values = values[~np.isnan(values).all(axis=1)] #at least one month is not NaN
     
-    df5 = df4.mean(axis=0)
-    station_temps = df5.to_numpy()
+    station_temps = np.nanmean(values, axis=1, dtype=np.float64)
     return station_temps
 
 
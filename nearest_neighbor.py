@@ -8,17 +8,76 @@ import numpy as np
 from scipy import linalg
 from scipy import spatial
 
+try:
+    from numba import njit, prange, get_num_threads
+except ImportError: # numba is optional, fall back to numpy
+    njit = None
+
+# number of columns of data handled at once by nn_brute_force
+_NN_BLOCK_SIZE = 4096
+
+# largest number of candidates nn_iterative searches without a kd-tree
+_NN_ITERATIVE_BRUTE_FORCE_MAX = 256
+
+# random number generator shared by the functions in this module
+_rng = np.random.default_rng()
+
 
 def create_column_data(num_elements, dimension, 
-                       lower_bound = -1.0, upper_bound = 1.0):    
+                       lower_bound = -1.0, upper_bound = 1.0, rng=None):    
     """
     The returned np.array has number of cols=num_elements and number of rows=dimension.
     Each column of the returned object is a data point containing values that 
     fall in the half-open interval [lower_bound, upper_bound).  The memory layout of
     the returned np.array is Fortran order (column major).
     
+    rng - An optional np.random.Generator used to sample the values, e.g. for
+        reproducible results.  The module's default generator is used if rng 
+        is None.
     """
-    return np.random.uniform(low=lower_bound, high=upper_bound, size=(dimension,num_elements))
+    if rng is None:
+        rng = _rng
+    # fill a Fortran ordered buffer directly instead of converting a C ordered one
+    data = np.empty((dimension,num_elements), order='F')
+    rng.random(out=data)
+    data *= upper_bound - lower_bound
+    data += lower_bound
+    return data
+
+
+if njit is not None:
+    @njit(parallel=True, fastmath={'reassoc', 'contract'})
+    def _nn_brute_force_jit(data, query):
+        """
+        Returns the index of the column of data closest to query.  Each thread
+        scans a contiguous range of columns, accumulating the squared distance
+        of every column in registers and keeping its own running minimum, so no
+        temporary array the size of data is created.  Ties go to the smallest
+        index, as with np.argmin.
+        """
+        (dimension, num_cols) = data.shape
+        num_chunks = get_num_threads()
+        chunk_size = (num_cols + num_chunks - 1) // num_chunks
+        best_dist = np.full(num_chunks, np.inf)
+        best_idx = np.zeros(num_chunks, dtype=np.int64)
+        for t in prange(num_chunks):
+            for j in range(t*chunk_size, min((t+1)*chunk_size, num_cols)):
+                dist_sq = 0.0
+                for i in range(dimension):
+                    diff = data[i,j] - query[i]
+                    dist_sq += diff*diff
+                if dist_sq < best_dist[t]:
+                    best_dist[t] = dist_sq
+                    best_idx[t] = j
+        
+        minindex = best_idx[0]
+        mindistance = best_dist[0]
+        for t in range(1, num_chunks):
+            if best_dist[t] < mindistance:
+                minindex = best_idx[t]
+                mindistance = best_dist[t]
+        return minindex
+
 
 def nn_brute_force(test_point, data):
     """
@@ -29,23 +88,38 @@ def nn_brute_force(test_point, data):
     test_point.  Note that this function returns a view of the column from data and not
     a copy.
     """
-    minindex = -1
-    mindistance = 100000000
-    
     if test_point is None or data is None:
         return (None,None)
-    else:
-        for i in range(np.shape(data)[1]):
-            if distance(data[:,[i]],test_point) < mindistance:
-                minindex = i
-                mindistance = distance(data[:,[i]],test_point)
+    
+    query = np.reshape(test_point, (-1,))
+    if query.shape[0] != np.shape(data)[0]:
+        raise ValueError("test_point has %d elements but the columns of data have %d"
+                         % (query.shape[0], np.shape(data)[0]))
+    
+    if njit is not None:
+        minindex = int(_nn_brute_force_jit(data, query))
         return (minindex, data[:,minindex])
+    
+    query = np.reshape(query, (-1,1))
+    num_cols = np.shape(data)[1]
+    
+    # process the columns in blocks so the temporary difference array stays small
+    minindex = -1
+    mindistance = np.inf
+    for start in range(0, num_cols, _NN_BLOCK_SIZE):
+        diff = data[:,start:start+_NN_BLOCK_SIZE] - query
+        dist_sq = np.einsum('ij,ij->j', diff, diff)
+        i = int(dist_sq.argmin())
+        if dist_sq[i] < mindistance:
+            minindex = start + i
+            mindistance = dist_sq[i]
+    return (minindex, data[:,minindex])
 
 
 def nn_create_kd_tree(data):
     """
     data is a set of column-based points to be spatially sorted into a kd-tree.
-    This function returns a scipy.spatial.KDTree object representing data or 
+    This function returns a scipy.spatial.cKDTree object representing data or 
     None if data is None.
     
     """
@@ -53,12 +127,12 @@ def nn_create_kd_tree(data):
         return None
     else:
         dataT = data.transpose() #transpose the data so rows are points so we can use query
-        return spatial.KDTree(dataT)
+        return spatial.cKDTree(dataT)
 
 
 def nn_query_kd_tree(test_point, tree):
     """
-    Given a test_point and a scipy.spatial.KDTree this function queries the
+    Given a test_point and a scipy.spatial.cKDTree this function queries the
     kd-tree for the closest point to test_point.  The function returns a tuple
     containing the index of the closest point in the tree along with the 
     closest point itself reshaped to match the shape of test_point.  
@@ -76,20 +150,33 @@ def nn_query_kd_tree(test_point, tree):
 
 
 
-def create_projection_matrix(n, m): 
+def create_projection_matrix(n, m, rng=None): 
     """
     Returns an np.array with n rows and m columns whose values are ranomly sampled
-    from a normal distribution (0.0, 1.0).  The memory layout for the returned
+    from a normal distribution (0.0, 1.0) and scaled by 1 / sqrt(n), where n is 
+    the size of the reduced dimension (k).  The memory layout for the returned
     np.array will be row-major.
     
-    We would like you to modify create_projection_matrix so that it 
-    returns a matrix whose random elements are scaled by 1 / sqrt(k), 
-    where k is the size of the reduced dimension.
+    rng - An optional np.random.Generator used to sample the values, e.g. for
+        reproducible results.  The module's default generator is used if rng 
+        is None.
     """
-    matrix = 1/math.sqrt(m) * np.random.uniform(low=0.0, high=1.0, size=(n,m))
+    matrix = _sample_projections((n,m), rng)
     return matrix
 
 
+def _sample_projections(shape, rng=None):
+    """
+    Returns an np.array of the given shape, whose last two axes are (k, m), with
+    values sampled from a normal distribution (0.0, 1.0) and scaled by 
+    1 / sqrt(k).  Any leading axes index a stack of projection matrices.
+    The module's default generator is used if rng is None.
+    """
+    if rng is None:
+        rng = _rng
+    return 1/math.sqrt(shape[-2]) * rng.standard_normal(size=shape)
+
+
 
 def compute_distortion(X, T_X):
     """
@@ -101,30 +188,37 @@ def compute_distortion(X, T_X):
     
     You need to compute the norms of the differences between all pairs of columns in X 
     in both the original space and the projected space.
+    
+    Pairs of coincident columns in X are skipped.  Returns 1.0 if no pair of distinct
+    columns remains, and np.inf if T_X maps two distinct columns of X to the same point.
     """
     
-    maximum1 = 0 #max ||f(X_i) - f(X_j)|| / ||X_i - X_j||
-    maximum2 = 0 #max ||X_i - X_j|| / ||f(X_i) - f(X_j)||
-    for i in range(len(X)):
-        for j in range(i+1,len(X)):
-            Xdist = distance(X[:,i],X[:,j])
-            T_Xdist = distance(T_X[:,i],T_X[:,j])
-            if T_Xdist / Xdist > maximum1:
-                maximum1 = T_Xdist / Xdist
-            if Xdist / T_Xdist > maximum2:
-                maximum2 = Xdist / T_Xdist
+    # condensed pairwise distances between columns, computed in C
+    Xdist = spatial.distance.pdist(X.T)
+    T_Xdist = spatial.distance.pdist(T_X.T)
+    
+    # ignore pairs of coincident points, whose ratios are undefined
+    mask = Xdist > 0
+    if not mask.any():
+        return 1.0
+    ratios = T_Xdist[mask] / Xdist[mask]
+    if (ratios == 0).any(): #distinct points collapsed by T
+        return np.inf
+    
+    maximum1 = ratios.max() #max ||f(X_i) - f(X_j)|| / ||X_i - X_j||
+    maximum2 = (1.0 / ratios).max() #max ||X_i - X_j|| / ||f(X_i) - f(X_j)||
     ans = maximum1*maximum2
     return ans
                 
 
 
-def iterate_reduced_nn(X, y, reduced_dimension, num_trials=10):
+def iterate_reduced_nn(X, y, reduced_dimension, num_trials=10, rng=None):
     """
     This function performs a number of nearest neighbor trials, each of which 
     consists of the projection of the input data set X and test point y to a 
     lower dimension and the nearest neighbor of the test point is sought in 
     the data set (in the lower dimension).  The nearest neighbor computation 
-    will be performed by first creating a scipy.spatial.KDTree with the 
+    will be performed by first creating a scipy.spatial.cKDTree with the 
     projected X and then querying it using the projected y.  The index of each
     identified nearest neighbor will be added to a list and only the unique
     indices returned (no duplicates).
@@ -135,26 +229,30 @@ def iterate_reduced_nn(X, y, reduced_dimension, num_trials=10):
     reduced_dimension - An integer representing the dimension of the reduced space
         in which the nearest neighbor computation will be performed.
     num_trials - The number of projection matrices to be tested.
+    rng - An optional np.random.Generator used to sample the projection matrices,
+        e.g. for reproducible results.  The module's default generator is used 
+        if rng is None.
     
     """
     
     data_dimension = np.shape(X)[0]
-    list1 = []
     
+    # all projection matrices stacked as one (num_trials, k, d) tensor so the
+    # projections of every trial are computed by a single batched matmul
+    A_all = _sample_projections((num_trials, reduced_dimension, data_dimension), rng)
+    reduced_X_all = A_all@X
+    reduced_y_all = A_all@np.reshape(y, (data_dimension,))
+    
+    list1 = []
     for trialnum in range(num_trials):
-        A = create_projection_matrix(reduced_dimension, data_dimension)
-        
-        reduced_X = A@X
-        reduced_y = A@y
-        
-        Tree = nn_create_kd_tree(reduced_X)
-        (idx, nn) = nn_query_kd_tree(reduced_y, Tree)
+        Tree = nn_create_kd_tree(reduced_X_all[trialnum])
+        (idx, nn) = nn_query_kd_tree(reduced_y_all[trialnum], Tree)
         list1.append(idx)
     uniquelist = list(np.unique(np.array(list1)))
     return uniquelist
 
 
-def nn_iterative(X, y, reduced_dimension, num_trials=10):
+def nn_iterative(X, y, reduced_dimension, num_trials=10, rng=None):
     """
     Perfrom a number of approximate nearest neighbor trials in a reduced space. 
     The results of those trials are used to select a subset of the data points in 
@@ -169,14 +267,21 @@ def nn_iterative(X, y, reduced_dimension, num_trials=10):
     reduced_dimension - An integer representing the dimension of the reduced space
         in which the nearest neighbor computation will be performed.
     num_trials - The number of projection matrices to be tested.
+    rng - An optional np.random.Generator used to sample the projection matrices,
+        e.g. for reproducible results.  The module's default generator is used 
+        if rng is None.
     
     """
-    list1 = iterate_reduced_nn(X, y, reduced_dimension, num_trials) #list of possible indices
+    list1 = iterate_reduced_nn(X, y, reduced_dimension, num_trials, rng) #list of possible indices
     X_new = X[:,list1]
     
-    tree = nn_create_kd_tree(X_new)
-    
-    (idx, nn) = nn_query_kd_tree(y, tree)
+    # a few candidates are searched faster directly than by building a kd-tree
+    if len(list1) <= _NN_ITERATIVE_BRUTE_FORCE_MAX:
+        (idx, nn) = nn_brute_force(y, X_new)
+    else:
+        tree = nn_create_kd_tree(X_new)
+        (idx, nn) = nn_query_kd_tree(y, tree)
+    idx = list1[idx] #index in X rather than in X_new
     
     ansvector = np.reshape(X[:,idx], np.shape(y))
     return (idx, ansvector)
@@ -7,22 +7,73 @@ a variety of graphs
 import numpy as np
 import cvxpy as cp
 
+try:
+    from numba import njit, prange
+    from numba.extending import is_jitted
+except ImportError: # numba is optional, fall back to pure Python
+    njit = None
 
-def optimize_sdp(n, dist_func, dist_arg=None, verbose=False):
+
+if njit is not None:
+    @njit(parallel=True)
+    def _dist_matrix_sq_jit(n, dist_func, dist_arg):
+        """
+        Fills the squared distance matrix in parallel over its rows, calling
+        the numba compiled dist_func for each pair with j <= i only.
+        """
+        dist_matrix_sq = np.empty((n,n))
+        for i in prange(n):
+            for j in range(i+1):
+                d = dist_func(i,j,dist_arg)
+                dist_matrix_sq[i,j] = d*d
+                dist_matrix_sq[j,i] = dist_matrix_sq[i,j]
+        return dist_matrix_sq
+
+
+def _compute_dist_matrix_sq(n, dist_func, dist_arg, vectorized=False):
+    """
+    Returns the n x n matrix of squared distances dist_func(i,j,dist_arg)**2.
+    If vectorized is True, dist_func is called once with (n,n) index arrays
+    and must return the (n,n) array of distances.  Otherwise, if dist_func is
+    compiled with numba the matrix is filled by a parallel numba kernel, and
+    if not it is called per pair with j <= i.  In both per pair cases the 
+    result is mirrored, as the distance is assumed to be symmetric.
+    """
+    if vectorized:
+        I, J = np.meshgrid(np.arange(n), np.arange(n), indexing='ij')
+        dist = np.asarray(dist_func(I, J, dist_arg), dtype=float)
+        if dist.shape != (n,n):
+            raise ValueError("vectorized dist_func returned an array of shape %s, expected %s"
+                             % (dist.shape, (n,n)))
+        return dist**2
+    
+    if njit is not None and is_jitted(dist_func):
+        return _dist_matrix_sq_jit(n, dist_func, dist_arg)
+    
+    dist_matrix_sq = np.zeros((n,n))
+    for i in range(n):
+        for j in range(i+1):
+            dist_matrix_sq[i,j] = dist_func(i,j,dist_arg)**2
+            dist_matrix_sq[j,i] = dist_matrix_sq[i,j]
+    return dist_matrix_sq
+
+
+def optimize_sdp(n, dist_func, dist_arg=None, verbose=False, vectorized=False):
     """
     n - The number of vertices in your graph
     dist_func - A distance function to be called as 
-            dist_func(i,j,dist_arg) for i,j in range(n)
+            dist_func(i,j,dist_arg) for i,j in range(n).  A function 
+            compiled with numba.njit is evaluated in parallel.
     dist_arg - An additional paramter to be passed to dist_func
     verbose - Flag to be passed to solve indicating whether or not
             it should display its progress during the solve.
+    vectorized - If True, dist_func is called once as dist_func(I,J,dist_arg)
+            with (n,n) integer arrays I and J of the row and column indices,
+            and must return the (n,n) array of distances.
     Returns - (optimization status, D, G, delta)
     """
     
-    dist_matrix_sq = np.zeros((n,n))
-    for i in range(n):
-        for j in range(n):
-            dist_matrix_sq[i,j] = dist_func(i,j,dist_arg)**2
+    dist_matrix_sq = _compute_dist_matrix_sq(n, dist_func, dist_arg, vectorized)
     
     # create variables
     delta = cp.Variable((n,n)) #symmetric matrix
@@ -34,12 +85,14 @@ def optimize_sdp(n, dist_func, dist_arg=None, verbose=False):
                    D2 >= 0,
                    dist_matrix_sq <= delta
                   ]
-    for i in range(1,n):
-        for j in range(1,n):
-            constraints += [
-                D2*dist_matrix_sq[i,j] >= delta[i,j],
-                G[i-1,j-1] == 1/2*(delta[0,i]+delta[0,j]-delta[i,j])
-            ]
+    # all (i,j) constraints for i,j in range(1,n) as matrix expressions;
+    # ones @ delta[0:1,1:] has delta[0,j] in every row (i-1,j-1)
+    ones = np.ones((n-1,1))
+    delta_0j = ones @ delta[0:1,1:]
+    constraints += [
+        D2*dist_matrix_sq[1:,1:] >= delta[1:,1:],
+        G == 1/2*(delta_0j.T + delta_0j - delta[1:,1:])
+    ]
     
     
     objective = cp.Minimize(D2) #later we take the square root
@@ -3,6 +3,183 @@ Basic sorting algorithms
 
 @author: Kari_Eifler
 """
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError: # numba is optional, fall back to pure Python
+    njit = None
+
+
+# ranges shorter than this are left to the final insertion sort pass
+_INSERTION_SORT_CUTOFF = 16
+
+
+def _lomuto_sort(elements, low_idx, high_idx):
+    """
+    Sorts elements[low_idx:high_idx+1] in place with Lomuto partitioning.
+    An explicit stack of (low, high) ranges is used instead of recursion
+    so that the same code runs both in Python and under numba.  The pivot
+    is the median of the first, middle and last element, and short ranges
+    are finished by a single insertion sort pass at the end.
+    """
+    stack = [(low_idx, high_idx)]
+    while len(stack) > 0:
+        lo, hi = stack.pop()
+        if hi-lo < _INSERTION_SORT_CUTOFF:
+            continue
+
+        #order the first, middle and last element and use the median as pivot
+        mid = (lo+hi)//2
+        if elements[mid] < elements[lo]:
+            elements[mid], elements[lo] = elements[lo], elements[mid]
+        if elements[hi] < elements[lo]:
+            elements[hi], elements[lo] = elements[lo], elements[hi]
+        if elements[hi] < elements[mid]:
+            elements[hi], elements[mid] = elements[mid], elements[hi]
+        elements[hi], elements[mid] = elements[mid], elements[hi]
+        pivot_value = elements[hi]
+
+        swap_idx = lo
+        for i in range(lo,hi):
+            if elements[i] < pivot_value:
+                elements[i], elements[swap_idx] = elements[swap_idx], elements[i]
+                swap_idx += 1 #increment the swap index
+        # Swap the pivot with the element in current swap location
+        elements[hi], elements[swap_idx] = elements[swap_idx], elements[hi]
+
+        #push the larger half first so the smaller half is sorted next
+        if swap_idx-lo > hi-swap_idx:
+            stack.append((lo, swap_idx-1))
+            stack.append((swap_idx+1, hi))
+        else:
+            stack.append((swap_idx+1, hi))
+            stack.append((lo, swap_idx-1))
+
+    #every element is now within a short range of its final position
+    for i in range(low_idx+1, high_idx+1):
+        value = elements[i]
+        j = i-1
+        while j >= low_idx and elements[j] > value:
+            elements[j+1] = elements[j]
+            j -= 1
+        elements[j+1] = value
+
+
+def _hoare_sort(elements, low_idx, high_idx):
+    """
+    Sorts elements[low_idx:high_idx+1] in place with Hoare partitioning.
+    An explicit stack of (low, high) ranges is used instead of recursion
+    so that the same code runs both in Python and under numba.  The pivot
+    is the median of the first, middle and last element, and short ranges
+    are finished by a single insertion sort pass at the end.
+    """
+    stack = [(low_idx, high_idx)]
+    while len(stack) > 0:
+        lo, hi = stack.pop()
+        if hi-lo < _INSERTION_SORT_CUTOFF:
+            continue
+
+        #order the first, middle and last element and use the median as pivot
+        mid = (lo+hi)//2
+        if elements[mid] < elements[lo]:
+            elements[mid], elements[lo] = elements[lo], elements[mid]
+        if elements[hi] < elements[lo]:
+            elements[hi], elements[lo] = elements[lo], elements[hi]
+        if elements[hi] < elements[mid]:
+            elements[hi], elements[mid] = elements[mid], elements[hi]
+        elements[lo], elements[mid] = elements[mid], elements[lo]
+
+        #partition around the first element, see partition_hoare
+        left_idx = lo-1
+        right_idx = hi+1
+        pivot_value = elements[lo]
+        while True:
+            right_idx -= 1
+            while elements[right_idx] > pivot_value:
+                right_idx -= 1
+            left_idx += 1
+            while elements[left_idx] < pivot_value:
+                left_idx += 1
+            if left_idx >= right_idx:
+                break
+            elements[left_idx], elements[right_idx] = elements[right_idx], elements[left_idx]
+        middle_idx = right_idx
+
+        #push the larger half first so the smaller half is sorted next
+        if middle_idx-lo > hi-middle_idx:
+            stack.append((lo, middle_idx))
+            stack.append((middle_idx+1, hi))
+        else:
+            stack.append((middle_idx+1, hi))
+            stack.append((lo, middle_idx))
+
+    #every element is now within a short range of its final position
+    for i in range(low_idx+1, high_idx+1):
+        value = elements[i]
+        j = i-1
+        while j >= low_idx and elements[j] > value:
+            elements[j+1] = elements[j]
+            j -= 1
+        elements[j+1] = value
+
+
+if njit is not None:
+    _lomuto_sort_jit = njit(cache=True)(_lomuto_sort)
+    _hoare_sort_jit = njit(cache=True)(_hoare_sort)
+else:
+    _lomuto_sort_jit = None
+    _hoare_sort_jit = None
+
+# dtypes the compiled sorts are used for
+_JIT_DTYPES = frozenset(np.dtype(t) for t in (np.int8, np.int16, np.int32, np.int64,
+                                              np.uint8, np.uint16, np.uint32, np.uint64,
+                                              np.float32, np.float64))
+
+
+def _run_sort(sort_func, sort_func_jit, elements, low_idx, high_idx):
+    """
+    Sorts elements[low_idx:high_idx+1] in place.  A np.array of a dtype
+    supported by numba is sorted by the compiled sort_func_jit directly.  A 
+    list whose elements are all int or all float is copied into a np.array, 
+    sorted by sort_func_jit and written back, provided the copy holds the 
+    exact same values.  Anything else (or a missing numba) is sorted by the
+    pure Python sort_func.
+    """
+    if sort_func_jit is not None:
+        if isinstance(elements, np.ndarray):
+            values = elements
+        else:
+            values = _number_list_as_array(elements)
+        if values is not None and values.ndim == 1 and values.dtype in _JIT_DTYPES:
+            sort_func_jit(values, low_idx, high_idx)
+            if values is not elements:
+                elements[low_idx:high_idx+1] = values[low_idx:high_idx+1].tolist()
+            return
+    sort_func(elements, low_idx, high_idx)
+
+
+def _number_list_as_array(elements):
+    """
+    Returns elements as a np.array if elements is a list whose items are all
+    of type int or all of type float and the conversion keeps every value
+    exactly, so that tolist gives back the original list.  Returns None 
+    otherwise, e.g. for mixed types or ints that do not fit in 64 bits.
+    """
+    if not isinstance(elements, list) or len(elements) == 0:
+        return None
+    first_type = type(elements[0])
+    if first_type is not int and first_type is not float:
+        return None
+    if any(type(value) is not first_type for value in elements):
+        return None
+    
+    values = np.asarray(elements)
+    expected_kinds = 'iu' if first_type is int else 'f'
+    if values.dtype.kind not in expected_kinds:
+        return None
+    return values
+
 
 def quicksort_lomuto(elements, low_idx=None, high_idx=None):
     """
@@ -17,6 +194,9 @@ def quicksort_lomuto(elements, low_idx=None, high_idx=None):
     high_idx - The ending value of the elements list to be 
                sorted.  Values appearing after this index are
                not touched.  Default is len(elements)-1.
+    
+    This is a reference implementation; use sort when only the
+    sorted result is needed.
     """
     
     if low_idx is None:
@@ -24,25 +204,8 @@ def quicksort_lomuto(elements, low_idx=None, high_idx=None):
     if high_idx is None:
         high_idx = len(elements)-1
     
-    pivot_value = elements[high_idx]
-    
-    swap_idx = low_idx
-    for i in range(low_idx,high_idx):
-        if elements[i] < pivot_value:
-            elements[i], elements[swap_idx] = elements[swap_idx], elements[i]
-            swap_idx += 1 #increment the swap index
-            continue
-    # Swap the pivot with the element in current swap location
-    elements[high_idx], elements[swap_idx] = elements[swap_idx], elements[high_idx]
-    
-    #here do it recursively
-    if swap_idx-1 > low_idx and swap_idx+1 < high_idx: #sort first AND second half
-        elements = quicksort_lomuto(elements,low_idx,swap_idx-1)
-        elements = quicksort_lomuto(elements, swap_idx+1, high_idx)
-    elif swap_idx-1 > low_idx and swap_idx+1 >= high_idx: #sort first half only
-        elements = quicksort_lomuto(elements,low_idx,swap_idx-1)
-    elif swap_idx-1 <= low_idx and swap_idx+1 < high_idx: #sort second half only
-        elements = quicksort_lomuto(elements, swap_idx+1, high_idx)
+    if low_idx < high_idx:
+        _run_sort(_lomuto_sort, _lomuto_sort_jit, elements, low_idx, high_idx)
     
     return elements
 
@@ -73,7 +236,7 @@ def partition_hoare(elements, low_idx = None, high_idx = None):
 def quicksort_hoare(elements, low_idx=None, high_idx=None):
     """
     This function sorts the elements list in place using the 
-    Lomuto partitioning scheme.  Only the values in the range
+    Hoare partitioning scheme.  Only the values in the range
     [low_idx, high_idx] are sorted by a call to this function.
     
     elements - A list of values to be sorted
@@ -83,6 +246,9 @@ def quicksort_hoare(elements, low_idx=None, high_idx=None):
     high_idx - The ending value of the elements list to be 
                sorted.  Values appearing after this index are
                not touched.  Default is len(elements)-1.
+    
+    This is a reference implementation; use sort when only the
+    sorted result is needed.
     """
     if low_idx is None:
         low_idx = 0
@@ -90,18 +256,43 @@ def quicksort_hoare(elements, low_idx=None, high_idx=None):
         high_idx = len(elements)-1
     
     if low_idx < high_idx:
-        MIDDLE = partition_hoare(elements,low_idx,high_idx)
-    
-        if MIDDLE > low_idx and MIDDLE+1 < high_idx: # if you need to do left and right
-            elements = quicksort_hoare(elements,low_idx,MIDDLE)
-            elements = quicksort_hoare(elements, MIDDLE+1, high_idx)
-        elif MIDDLE > low_idx and MIDDLE+1 >= high_idx: # if you need to do only left
-            elements = quicksort_hoare(elements,low_idx,MIDDLE)
-        elif MIDDLE <= low_idx and MIDDLE+1 < high_idx: # if you need to do only right
-            elements = quicksort_hoare(elements, MIDDLE+1, high_idx)
+        _run_sort(_hoare_sort, _hoare_sort_jit, elements, low_idx, high_idx)
     
     return elements
 
 
+def sort(elements, method='auto'):
+    """
+    This function sorts elements in place with the sorting routine
+    of the underlying container and returns it.
+
+    elements - A list or 1D np.array of values to be sorted
+    method   - 'numpy' copies the values into a np.array, sorts it
+               with np.sort and writes the result back (elements
+               of a np.array are sorted in place).  A list is only
+               copied when its items are all int or all float and
+               survive the conversion unchanged (see 
+               _number_list_as_array); any other list raises a 
+               ValueError.  'python' uses list.sort (Timsort).  
+               'auto', the default, picks 'numpy' for np.arrays and
+               'python' for everything else.
+    """
+    if method == 'auto':
+        method = 'numpy' if isinstance(elements, np.ndarray) else 'python'
 
+    if method == 'numpy':
+        if isinstance(elements, np.ndarray):
+            elements.sort()
+        elif len(elements) > 1:
+            values = _number_list_as_array(elements)
+            if values is None:
+                raise ValueError("method 'numpy' needs a list of all int or all float values "
+                                 "that fit a np.array exactly, use method 'python' instead")
+            values.sort()
+            elements[:] = values.tolist()
+    elif method == 'python':
+        elements.sort()
+    else:
+        raise ValueError("method must be 'auto', 'numpy' or 'python', got %r" % (method,))
 
+    return elements
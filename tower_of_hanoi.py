@@ -38,39 +38,39 @@ def hanoi(initial_state, solution, num_towers, num_discs, start_tower_idx, targe
     # Use the list `solution` to store the steps of your algorithm as
     # described above.
     
-    #initialize solution if necessary
-    if solution == []:
-        solution = [copy.deepcopy(initial_state)]
-    
     #find extra tower we can use to move discs around
     extra_tower_idx = 0
     while extra_tower_idx == start_tower_idx or extra_tower_idx == target_tower_idx:
         extra_tower_idx += 1
     
-    if num_discs == 1:
-        #move the one disc - top disc - from start_tower_idx to target_tower_idx
-        disc_moved = initial_state[start_tower_idx][-1]
-        del initial_state[start_tower_idx][-1]
-        initial_state[target_tower_idx].append(copy.deepcopy(disc_moved))
-        
-        #update solution
-        solution.append(copy.deepcopy(initial_state))
-        
-    elif num_discs > 1:
-        #move the num_discs from start_tower_idx to target_tower_idx by recurssion
-        
-        #move smaller stack above disc of interest to extra_tower_idx
-        hanoi(initial_state, solution, num_towers, num_discs-1, start_tower_idx, extra_tower_idx)
-        
-        #move disc of interest to target_tower_idx
-        disc_moved = initial_state[start_tower_idx][-1]
-        del initial_state[start_tower_idx][-1]
-        initial_state[target_tower_idx].append(copy.deepcopy(disc_moved))
-        
-        #update solution
-        solution.append(copy.deepcopy(initial_state))
-        
-        #move smaller stack back ontop of disc of interest
-        hanoi(initial_state, solution, num_towers, num_discs-1, extra_tower_idx, target_tower_idx)
+    moves = []
+    _hanoi_moves(moves, num_discs, start_tower_idx, target_tower_idx, extra_tower_idx)
+    
+    #replay the moves on a working copy, recording a snapshot after each one
+    state = [list(tower) for tower in initial_state]
+    if solution == []:
+        solution.append([list(tower) for tower in state])
+    for (from_idx, to_idx) in moves:
+        state[to_idx].append(state[from_idx].pop())
+        solution.append([list(tower) for tower in state])
         
     return solution
+
+
+def _hanoi_moves(moves, num_discs, start_tower_idx, target_tower_idx, extra_tower_idx):
+    """
+    Appends to moves the (from_idx, to_idx) pairs of tower indices that move
+    num_discs discs from start_tower_idx to target_tower_idx using
+    extra_tower_idx as the spare tower.
+    """
+    if num_discs < 1:
+        return
+    
+    #move smaller stack above disc of interest to extra_tower_idx
+    _hanoi_moves(moves, num_discs-1, start_tower_idx, extra_tower_idx, target_tower_idx)
+    
+    #move disc of interest to target_tower_idx
+    moves.append((start_tower_idx, target_tower_idx))
+    
+    #move smaller stack back ontop of disc of interest
+    _hanoi_moves(moves, num_discs-1, extra_tower_idx, target_tower_idx, start_tower_idx)